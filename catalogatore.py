@@ -1,8 +1,18 @@
 import os
+import re
 import shutil
 import subprocess
 import hashlib
+import codecs
+import mmap
 import tempfile
+import socket
+import time
+import pathlib
+import queue
+from functools import lru_cache, partial
+from itertools import chain, groupby
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
 import tkinter as tk
@@ -10,16 +20,120 @@ from tkinter import filedialog, messagebox, ttk, StringVar
 from ttkthemes import ThemedTk
 import matplotlib.pyplot as plt
 import seaborn as sns
-from scipy.cluster.hierarchy import linkage, dendrogram
+from scipy.cluster.hierarchy import dendrogram
+# fastcluster è un sostituto più veloce di scipy per linkage, con la stessa interfaccia
+try:
+    from fastcluster import linkage
+except ImportError:
+    from scipy.cluster.hierarchy import linkage
 from sklearn.decomposition import PCA
 from sklearn.manifold import MDS
 from sklearn.cluster import KMeans
 
+# Numba è opzionale: se presente compila il calcolo delle distanze di Hamming
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+# Il bridge UNO è disponibile solo se Python è quello fornito con LibreOffice (o ne vede i moduli)
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+    from com.sun.star.connection import NoConnectException
+    from com.sun.star.lang import DisposedException
+except ImportError:
+    uno = None
+
 # ================================
 # Funzioni principali
 # ================================
 
+def iter_files(root, skip_folder=None):
+    """
+    Scorre ricorsivamente root e restituisce le voci (os.DirEntry) dei file trovati.
+
+    Usa os.scandir, che ricava il tipo di ogni voce dalla lettura della directory senza
+    chiamate os.stat aggiuntive. I collegamenti simbolici a cartelle non vengono seguiti.
+
+    :param root: Directory da esplorare.
+    :param skip_folder: Funzione opzionale che riceve il nome di una cartella e restituisce True se va saltata.
+
+    I file di una stessa cartella vengono restituiti consecutivamente.
+    """
+    subfolders = []
+    try:
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if skip_folder is None or not skip_folder(entry.name):
+                        subfolders.append(entry.path)
+                elif entry.is_file():
+                    yield entry
+    except OSError as e:
+        # Come os.walk: una cartella illeggibile viene saltata senza interrompere la scansione
+        print(f"Impossibile leggere la cartella {root}: {e}")
+    # La directory viene chiusa prima di scendere nelle sottocartelle
+    for folder in subfolders:
+        yield from iter_files(folder, skip_folder)
+
+
 # Fase 0: Pre-lavorazione
+
+# Numero di thread per la copia: il lavoro è dominato dalle chiamate di sistema (open/stat/close)
+COPY_WORKERS = min(32, (os.cpu_count() or 1) * 2)
+
+
+def _copytree_multithreaded(source_dir, target_dir):
+    """
+    Copia ricorsivamente source_dir in target_dir, come shutil.copytree(dirs_exist_ok=True),
+    ma copiando i file in parallelo.
+
+    La struttura delle cartelle viene creata prima, dal thread principale; gli errori sulle
+    singole cartelle e sui singoli file vengono raccolti e sollevati insieme alla fine come shutil.Error.
+    Come os.walk, i collegamenti simbolici a cartelle non vengono seguiti (né copiati).
+    """
+    pending = [(source_dir, target_dir)]
+    directories = []
+    copies = []
+    errors = []
+    while pending:
+        src_dir, dst_dir = pending.pop()
+        try:
+            os.makedirs(dst_dir, exist_ok=True)
+            with os.scandir(src_dir) as entries:
+                for entry in entries:
+                    dst = os.path.join(dst_dir, entry.name)
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append((entry.path, dst))
+                    elif entry.is_symlink() and entry.is_dir():
+                        print(f"Collegamento a cartella non copiato: {entry.path}")
+                    else:
+                        copies.append((entry.path, dst))
+        except OSError as e:
+            errors.append((src_dir, dst_dir, str(e)))
+            continue
+        directories.append((src_dir, dst_dir))
+
+    with ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+        futures = {executor.submit(shutil.copy2, src, dst): (src, dst) for src, dst in copies}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except OSError as e:
+                src, dst = futures[future]
+                errors.append((src, dst, str(e)))
+
+    # Copia i metadati delle cartelle solo dopo i file, che altrimenti ne modificherebbero la data
+    for src_dir, dst_dir in directories:
+        try:
+            shutil.copystat(src_dir, dst_dir)
+        except OSError as e:
+            errors.append((src_dir, dst_dir, str(e)))
+
+    if errors:
+        raise shutil.Error(errors)
+
 def prepare_working_directory(source_dir, working_dir, target_subdir="0-corpus"):
     """
     Crea un ambiente protetto con una struttura organizzata.
@@ -39,14 +153,7 @@ def prepare_working_directory(source_dir, working_dir, target_subdir="0-corpus")
         os.makedirs(target_dir)
 
     try:
-        for root, dirs, files in os.walk(source_dir):
-            for file in files:
-                source_file = os.path.join(root, file)
-                relative_path = os.path.relpath(root, source_dir)
-                target_subfolder = os.path.join(target_dir, relative_path)
-                os.makedirs(target_subfolder, exist_ok=True)
-                target_file = os.path.join(target_subfolder, file)
-                shutil.copy2(source_file, target_file)
+        _copytree_multithreaded(source_dir, target_dir)
     except Exception as e:
         print(f"Errore durante la preparazione della working directory: {e}")
         raise
@@ -62,6 +169,269 @@ def prepare_working_directory(source_dir, working_dir, target_subdir="0-corpus")
 # Fase 1: Estrazione dei file di testo
 # ================================
 
+# Numero di istanze di LibreOffice eseguite in parallelo: la conversione è limitata dalla CPU
+CONVERSION_WORKERS = os.cpu_count() or 1
+
+# File convertiti con una sola esecuzione di LibreOffice, per ammortizzarne l'avvio
+CONVERSION_BATCH_SIZE = 200
+
+# Lunghezza massima complessiva dei percorsi passati a una sola esecuzione (limite di Windows: 32767)
+CONVERSION_BATCH_CHARS = 24000
+
+# Tempo massimo di attesa per l'avvio dell'istanza di LibreOffice in ascolto (secondi)
+LIBREOFFICE_STARTUP_TIMEOUT = 60
+
+
+def _uno_property(name, value):
+    """Crea una PropertyValue UNO."""
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+def _start_libreoffice_listener(LIBREOFFICE_PATH, profile_dir):
+    """
+    Avvia una sola istanza di LibreOffice in ascolto su un socket locale e vi si collega tramite UNO.
+
+    Il profilo utente dedicato (profile_dir) evita conflitti con altre istanze già aperte.
+    Restituisce la coppia (processo, desktop).
+    """
+    # Porta libera assegnata dal sistema operativo
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    process = subprocess.Popen(
+        [LIBREOFFICE_PATH, "--headless", "--invisible", "--nologo", "--norestore",
+         f"-env:UserInstallation={uno.systemPathToFileUrl(profile_dir)}",
+         f"--accept=socket,host=127.0.0.1,port={port};urp;"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    try:
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_context)
+        deadline = time.monotonic() + LIBREOFFICE_STARTUP_TIMEOUT
+        while True:
+            try:
+                context = resolver.resolve(
+                    f"uno:socket,host=127.0.0.1,port={port};urp;StarOffice.ComponentContext")
+                break
+            except NoConnectException:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("Impossibile collegarsi all'istanza di LibreOffice in ascolto.")
+                time.sleep(0.5)
+
+        desktop = context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+    except BaseException:
+        # Qualunque errore dopo l'avvio non deve lasciare LibreOffice in esecuzione sul profilo
+        process.kill()
+        process.wait()
+        raise
+
+    return process, desktop
+
+
+def _stop_libreoffice_listener(process, desktop):
+    """Chiude l'istanza di LibreOffice avviata da _start_libreoffice_listener."""
+    try:
+        desktop.terminate()
+    except Exception:
+        # La connessione si interrompe mentre LibreOffice si chiude
+        pass
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def _restart_libreoffice_listener(LIBREOFFICE_PATH, profile_dir, process, desktop):
+    """
+    Riavvia l'istanza di LibreOffice in ascolto dopo che si è chiusa (ad esempio per un documento danneggiato).
+
+    Restituisce la nuova coppia (processo, desktop), oppure (None, None) se il riavvio non riesce:
+    in quel caso le conversioni proseguono da riga di comando.
+    """
+    _stop_libreoffice_listener(process, desktop)
+    try:
+        return _start_libreoffice_listener(LIBREOFFICE_PATH, profile_dir)
+    except Exception as e:
+        print(f"Riavvio di LibreOffice non riuscito ({e}): uso la conversione da riga di comando.")
+        return None, None
+
+
+def _convert_with_uno(desktop, source_file, target_file):
+    """Converte un file in formato ODT usando un'istanza di LibreOffice già avviata."""
+    source_url = uno.systemPathToFileUrl(os.path.abspath(source_file))
+    target_url = uno.systemPathToFileUrl(os.path.abspath(target_file))
+    doc = desktop.loadComponentFromURL(source_url, "_blank", 0, (_uno_property("Hidden", True),))
+    if doc is None:
+        raise RuntimeError("LibreOffice non è riuscito ad aprire il file.")
+    try:
+        doc.storeToURL(target_url, (_uno_property("FilterName", "writer8"),))
+    finally:
+        doc.close(True)
+
+
+# Tipo MIME che apre ogni file ODT (primo elemento dell'archivio zip, non compresso)
+ODT_MIMETYPE = b"application/vnd.oasis.opendocument.text"
+
+# Firme iniziali di file che non sono documenti (immagini, eseguibili): LibreOffice non ne estrae testo
+NON_DOCUMENT_SIGNATURES = (b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff", b"GIF87a", b"GIF89a", b"\x7fELF")
+
+
+def _sniff_file_type(file_path):
+    """
+    Riconosce il tipo di un file dai primi byte, senza avviare LibreOffice.
+
+    Restituisce "odt" per i documenti già in formato ODT, "non_documento" per immagini ed eseguibili
+    e "altro" per tutti gli altri file, che vanno convertiti.
+    """
+    with open(file_path, "rb") as f:
+        header = f.read(128)
+
+    # ODT: archivio zip il cui primo file è "mimetype", seguito subito dall'intestazione successiva
+    if header.startswith(b"PK\x03\x04") and header[30:38] == b"mimetype" \
+            and header[38:38 + len(ODT_MIMETYPE) + 2] == ODT_MIMETYPE + b"PK":
+        return "odt"
+    if header.startswith(NON_DOCUMENT_SIGNATURES):
+        return "non_documento"
+    # Eseguibili DOS/Windows: "MZ" seguito da un'intestazione binaria
+    if header.startswith(b"MZ") and b"\x00" in header[:64]:
+        return "non_documento"
+    return "altro"
+
+
+def _group_conversions(conversions):
+    """
+    Raggruppa le conversioni per cartella di destinazione, in gruppi adatti a una sola chiamata a LibreOffice.
+
+    Ogni gruppo contiene al massimo CONVERSION_BATCH_SIZE file e resta entro CONVERSION_BATCH_CHARS
+    caratteri di percorsi, per non superare la lunghezza massima della riga di comando (Windows).
+    Nella stessa cartella di destinazione i nomi dei file convertiti sono univoci, quindi i file
+    di un gruppo non si sovrascrivono nella directory temporanea.
+    """
+    groups = []
+    for _, items in groupby(conversions, key=lambda item: os.path.dirname(item[1])):
+        group, length = [], 0
+        for source_file, target_file in items:
+            if group and (len(group) >= CONVERSION_BATCH_SIZE or length + len(source_file) > CONVERSION_BATCH_CHARS):
+                groups.append(group)
+                group, length = [], 0
+            group.append((source_file, target_file))
+            length += len(source_file) + 1
+        groups.append(group)
+    return groups
+
+
+def _converted_path(output_dir, source_file):
+    """Percorso del file ODT prodotto da LibreOffice per source_file in output_dir (--outdir)."""
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(source_file))[0] + ".odt")
+
+
+def _convert_files(LIBREOFFICE_PATH, group_queue, worker_dir):
+    """
+    Converte in ODT i gruppi di coppie (sorgente, destinazione) con un'istanza di LibreOffice dedicata.
+
+    Eseguita in un thread di lavoro, che preleva i gruppi dalla coda condivisa finché non è vuota:
+    chi finisce prima prende il gruppo successivo. Ogni worker usa una propria directory, con il profilo utente
+    (-env:UserInstallation) e i file temporanei, così che più istanze di LibreOffice possano
+    lavorare in parallelo senza confluire in una sola.
+    """
+    profile_dir = os.path.join(worker_dir, "profile")
+    temp_dir = os.path.join(worker_dir, "output")
+    os.makedirs(temp_dir, exist_ok=True)
+
+    # Se possibile, una sola istanza di LibreOffice resta aperta per tutte le conversioni del worker
+    office_process = desktop = None
+    if uno is not None:
+        try:
+            office_process, desktop = _start_libreoffice_listener(LIBREOFFICE_PATH, profile_dir)
+        except Exception as e:
+            print(f"Connessione UNO non disponibile ({e}): uso la conversione da riga di comando.")
+
+    try:
+        while True:
+            try:
+                group = group_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if desktop is not None:
+                # Conversione tramite l'istanza di LibreOffice già avviata
+                pending = iter(group)
+                for source_file, target_file in pending:
+                    try:
+                        print(f"Elaborazione del file: {source_file}")
+                        _convert_with_uno(desktop, source_file, target_file)
+                        print(f"File convertito e salvato in: {target_file}")
+                    except Exception as e:
+                        print(f"Errore durante l'elaborazione del file {source_file}: {e}")
+                        # Se LibreOffice si è chiuso, i file successivi fallirebbero tutti: va riavviato
+                        if office_process.poll() is not None or isinstance(e, DisposedException):
+                            office_process, desktop = _restart_libreoffice_listener(
+                                LIBREOFFICE_PATH, profile_dir, office_process, desktop)
+                            if desktop is None:
+                                break
+
+                # I file rimasti, se LibreOffice non è ripartito, vengono convertiti da riga di comando
+                group = list(pending)
+                if not group:
+                    continue
+
+            # Conversione in formato ODT di tutto il gruppo con una sola esecuzione di LibreOffice
+            source_files = [source_file for source_file, _ in group]
+            for source_file in source_files:
+                print(f"Elaborazione del file: {source_file}")
+            command = [LIBREOFFICE_PATH, "--headless", f"-env:UserInstallation={pathlib.Path(profile_dir).as_uri()}",
+                       "--convert-to", "odt"]
+            try:
+                subprocess.run(
+                    [*command, *source_files, "--outdir", temp_dir],
+                    check=True,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE
+                )
+            except subprocess.CalledProcessError as e:
+                # Un solo file danneggiato può interrompere l'intero gruppo:
+                # i file non ancora convertiti vengono ritentati uno alla volta
+                print(f"Errore durante la conversione di {len(source_files)} file: {e}")
+                for source_file in source_files:
+                    if os.path.exists(_converted_path(temp_dir, source_file)):
+                        continue
+                    try:
+                        subprocess.run(
+                            [*command, source_file, "--outdir", temp_dir],
+                            check=True,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE
+                        )
+                    except subprocess.CalledProcessError as e:
+                        print(f"Errore durante la conversione di {source_file}: {e}")
+            except Exception as e:
+                print(f"Errore durante l'elaborazione di {len(source_files)} file: {e}")
+                continue
+
+            # Copia i file convertiti nella destinazione finale
+            for source_file, target_file in group:
+                temp_output_file = _converted_path(temp_dir, source_file)
+                try:
+                    if os.path.exists(temp_output_file):
+                        shutil.move(temp_output_file, target_file)
+                        print(f"File convertito e salvato in: {target_file}")
+                    else:
+                        print(f"Errore nella conversione del file: {source_file}")
+                except Exception as e:
+                    print(f"Errore durante l'elaborazione del file {source_file}: {e}")
+
+    finally:
+        if desktop is not None:
+            _stop_libreoffice_listener(office_process, desktop)
+
+
 def extract_text_and_recreate_structure(source_dir, output_dir, LIBREOFFICE_PATH=None):
     """
     Utilizza LibreOffice per convertire i file in formato ODT mantenendo la struttura della directory.
@@ -94,58 +464,73 @@ def extract_text_and_recreate_structure(source_dir, output_dir, LIBREOFFICE_PATH
     # Crea la directory di output se non esiste
     os.makedirs(output_dir, exist_ok=True)
 
-    # Directory temporanea per i file convertiti
-    temp_dir = os.path.join(tempfile.gettempdir(), "temp_text")
-    os.makedirs(temp_dir, exist_ok=True)
+    # Raccoglie prima tutte le conversioni da eseguire
+    conversions = []
+    planned_targets = set()
+    source_folder = target_dir = None
+    # Le directory escluse non vengono nemmeno visitate
+    for entry in iter_files(source_dir, skip_folder=lambda name: should_exclude(name, is_folder=True)):
+        source_file = entry.path
+
+        # Crea la struttura della directory di destinazione, una volta per cartella sorgente
+        if os.path.dirname(source_file) != source_folder:
+            source_folder = os.path.dirname(source_file)
+            target_dir = os.path.join(output_dir, os.path.relpath(source_folder, source_dir))
+            os.makedirs(target_dir, exist_ok=True)
 
-    try:
-        for root, dirs, files in os.walk(source_dir):
-            # Escludi le directory specificate
-            dirs[:] = [d for d in dirs if not should_exclude(d, is_folder=True)]
+        file = entry.name
+        if should_exclude(file):
+            print(f"File escluso: {file} (criterio: esclusione predefinita)")
+            continue
 
-            # Crea la struttura della directory di destinazione
-            relative_path = os.path.relpath(root, source_dir)
-            target_dir = os.path.join(output_dir, relative_path)
-            os.makedirs(target_dir, exist_ok=True)
+        target_file = os.path.join(target_dir, os.path.splitext(file)[0] + ".odt")
 
-            for file in files:
-                if should_exclude(file):
-                    print(f"File escluso: {file} (criterio: esclusione predefinita)")
-                    continue
+        if target_file in planned_targets or os.path.exists(target_file):
+            print(f"File già convertito: {target_file}. Salto.")
+            continue
 
-                source_file = os.path.join(root, file)
-                target_file = os.path.join(target_dir, os.path.splitext(file)[0] + ".odt")
+        # Riconosce dai primi byte i file che non richiedono LibreOffice
+        try:
+            file_type = _sniff_file_type(source_file)
+        except OSError as e:
+            print(f"Errore durante l'elaborazione del file {source_file}: {e}")
+            continue
 
-                if os.path.exists(target_file):
-                    print(f"File già convertito: {target_file}. Salto.")
-                    continue
+        if file_type == "non_documento":
+            print(f"File escluso: {file} (criterio: contenuto non documentale)")
+            continue
 
-                try:
-                    print(f"Elaborazione del file: {source_file}")
-
-                    # Conversione del file in formato ODT con LibreOffice
-                    subprocess.run(
-                        [LIBREOFFICE_PATH, "--headless", "--convert-to", "odt", source_file, "--outdir", temp_dir],
-                        check=True,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE
-                    )
+        planned_targets.add(target_file)
+        if file_type == "odt":
+            # Già in formato ODT: basta copiarlo
+            try:
+                shutil.copy2(source_file, target_file)
+                print(f"File già in formato ODT, copiato in: {target_file}")
+            except OSError as e:
+                print(f"Errore durante l'elaborazione del file {source_file}: {e}")
+            continue
 
-                    # Copia il file convertito nella destinazione finale
-                    temp_output_file = os.path.join(temp_dir, os.path.splitext(file)[0] + ".odt")
-                    if os.path.exists(temp_output_file):
-                        shutil.move(temp_output_file, target_file)
-                        print(f"File convertito e salvato in: {target_file}")
-                    else:
-                        print(f"Errore nella conversione del file: {source_file}")
+        conversions.append((source_file, target_file))
 
-                except subprocess.CalledProcessError as e:
-                    print(f"Errore durante la conversione di {source_file}: {e}")
-                except Exception as e:
-                    print(f"Errore durante l'elaborazione del file {source_file}: {e}")
+    # Directory temporanea per i file convertiti, con una sottocartella per ogni worker
+    temp_dir = os.path.join(tempfile.gettempdir(), f"temp_text_{os.getpid()}")
+    groups = _group_conversions(conversions)
+
+    # Coda condivisa tra i worker, con i gruppi più grandi per primi così che nessuno resti indietro
+    group_queue = queue.Queue()
+    for group in sorted(groups, key=len, reverse=True):
+        group_queue.put(group)
+    n_workers = min(CONVERSION_WORKERS, len(groups))
+    worker_dirs = [os.path.join(temp_dir, f"worker_{i}") for i in range(n_workers)]
+
+    try:
+        # Se non c'è nulla da convertire non viene avviata nessuna istanza di LibreOffice
+        if n_workers:
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                list(executor.map(partial(_convert_files, LIBREOFFICE_PATH, group_queue), worker_dirs))
 
     finally:
-        # Rimuove i file temporanei
+        # Rimuove i file temporanei e i profili di LibreOffice
         shutil.rmtree(temp_dir, ignore_errors=True)
         print("Processo completato.")
 
@@ -174,71 +559,166 @@ EXCLUDED_FOLDERS = [
     "Trash"
 ]
 
+# Sottostringhe che escludono un file ovunque compaiano nel nome
+EXCLUDED_FILE_PATTERNS = ["delete-log", "desktopprinters db", "openfolderlistdf"]
+
+
+def _compile_exclusions():
+    """
+    Compila le liste di esclusione in due espressioni regolari, una per i file e una per le cartelle.
+
+    Va richiamata ogni volta che le liste vengono modificate.
+    """
+    global _EXCLUDED_FILE_RE, _EXCLUDED_FOLDER_RE
+
+    names = "|".join(re.escape(name) for name in EXCLUDED_NAMES if name)
+    file_patterns = [re.escape(pattern) for pattern in EXCLUDED_FILE_PATTERNS if pattern]
+    file_patterns += [
+        rf"\A(?:{names})\Z",  # nome esatto
+        r"\A\.", r"\.tmp\Z", r"~\Z", r"\.copy0\Z", r"\Adesktop\.ini\Z"
+    ]
+    _EXCLUDED_FILE_RE = re.compile("|".join(file_patterns), re.IGNORECASE)
+
+    folder_patterns = [re.escape(pattern) for pattern in EXCLUDED_FOLDERS if pattern]
+    # "(?!)" non corrisponde mai: nessuna cartella esclusa se la lista è vuota
+    _EXCLUDED_FOLDER_RE = re.compile("|".join(folder_patterns) or "(?!)", re.IGNORECASE)
+
+
+_compile_exclusions()
+
+
+@lru_cache(maxsize=4096)
 def should_exclude(name, is_folder=False):
-    """Verifica se un file o una cartella deve essere escluso."""
-    name_lower = name.lower()
-    if is_folder:
-        # Controlla se la cartella deve essere esclusa
-        if any(pattern in name_lower for pattern in EXCLUDED_FOLDERS):
-            return True
-    else:
-        # Controlla se il file deve essere escluso
-        exclude_patterns = ["delete-log", "desktopprinters db", "openfolderlistdf"]
-        if any(pattern in name_lower for pattern in exclude_patterns):
-            return True
-        if name_lower in EXCLUDED_NAMES or name_lower.startswith('.') or name_lower.endswith('.tmp') \
-                or name_lower == "desktop.ini" or name_lower.endswith('~') or name_lower.endswith('.copy0'):
-            return True
-    return False
+    """
+    Verifica se un file o una cartella deve essere escluso.
+
+    Il risultato viene memorizzato per nome: i nomi ricorrenti (ad es. "Desktop DB" o
+    "System Volume Information" in ogni floppy) vengono valutati una sola volta.
+    Dopo aver modificato le liste di esclusione va svuotata la cache con should_exclude.cache_clear().
+    """
+    pattern = _EXCLUDED_FOLDER_RE if is_folder else _EXCLUDED_FILE_RE
+    return pattern.search(name) is not None
 
 
 # ================================
 # Fase 2: Hashing
 # ================================
 
+# Numero di thread per l'hashing: il lavoro è dominato dall'I/O su disco
+HASH_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Dimensione del buffer di lettura per l'hashing (64 KiB)
+HASH_BUFFER_SIZE = 64 * 1024
+
+# Byte dell'hash SHA-256 conservati: 128 bit bastano a evitare collisioni anche su miliardi di file
+HASH_DIGEST_BYTES = 16
+
+# Oltre questa dimensione il file viene mappato in memoria e passato all'hash in un'unica chiamata
+HASH_MMAP_THRESHOLD = 1024 * 1024
+
+
+def _is_valid_utf8(blocks):
+    """Verifica in modo incrementale che una sequenza di blocchi di byte sia testo UTF-8 valido."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for block in blocks:
+            decoder.decode(block)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def _hash_one(file_path, root_folder):
+    """
+    Calcola l'hash di un singolo file senza caricarlo interamente in memoria.
+
+    I file piccoli vengono letti a blocchi da 64 KiB; quelli grandi vengono mappati in memoria
+    e passati a OpenSSL in un'unica chiamata. Nella stessa elaborazione verifica se il contenuto
+    è testo UTF-8 valido.
+    Eseguita nei thread di lavoro: non deve mai interagire con Tkinter.
+    Restituisce una tupla (root_folder, hash, tipo), dove hash sono i primi HASH_DIGEST_BYTES byte
+    del digest SHA-256 e tipo è "testo", "non_testuale" (hash da confermare con l'utente) oppure "errore".
+    """
+    try:
+        h = hashlib.new("sha256", usedforsecurity=False)
+        with open(file_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size >= HASH_MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    h.update(mm)
+                    is_text = _is_valid_utf8(
+                        mm[offset:offset + HASH_BUFFER_SIZE] for offset in range(0, len(mm), HASH_BUFFER_SIZE)
+                    )
+            else:
+                # Un solo buffer riutilizzato: la verifica UTF-8 avviene durante la lettura
+                decoder = codecs.getincrementaldecoder("utf-8")()
+                is_text = True
+                buffer = bytearray(HASH_BUFFER_SIZE)
+                view = memoryview(buffer)
+                while n := f.readinto(buffer):
+                    h.update(view[:n])
+                    if is_text:
+                        try:
+                            decoder.decode(view[:n])
+                        except UnicodeDecodeError:
+                            is_text = False
+                if is_text:
+                    try:
+                        decoder.decode(b"", final=True)
+                    except UnicodeDecodeError:
+                        is_text = False
+        return root_folder, h.digest()[:HASH_DIGEST_BYTES], "testo" if is_text else "non_testuale"
+    except Exception as e:
+        print(f"Errore durante il calcolo dell'hash per {file_path}: {e}")
+        return root_folder, None, "errore"
+
+
 def calculate_hashes(base_dir):
     """
     Scorre ricorsivamente la directory fornita e calcola gli hash dei file in base al contenuto testuale,
     oppure – se non leggibile – chiede all'utente se procedere con hash binario.
+
+    Gli hash vengono calcolati in parallelo; la richiesta all'utente per i file non testuali
+    avviene una sola volta, al termine, dal thread principale.
     """
     from collections import defaultdict
     hash_dict = defaultdict(set)
 
-    for root, _, files in os.walk(base_dir):
-        relative_path = os.path.relpath(root, base_dir)
-        root_folder = relative_path.split(os.sep)[0]
-
-        for file in files:
-            file_path = os.path.join(root, file)
-
-            # Prova con lettura testuale
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    text = f.read()
-                file_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    # Raccoglie prima tutti i file da elaborare
+    file_paths = []
+    root_folders = []
+    folder = root_folder = None
+    for entry in iter_files(base_dir):
+        if os.path.dirname(entry.path) != folder:
+            folder = os.path.dirname(entry.path)
+            root_folder = os.path.relpath(folder, base_dir).split(os.sep)[0]
+        file_paths.append(entry.path)
+        root_folders.append(root_folder)
+
+    non_text = []
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+        for file_path, (root_folder, file_hash, kind) in zip(
+                file_paths, executor.map(_hash_one, file_paths, root_folders)):
+            if kind == "testo":
                 hash_dict[root_folder].add(file_hash)
                 print(f"[TESTO] Hash calcolato per: {file_path}")
-
-            except UnicodeDecodeError:
-                # Fallita lettura testuale → popup all'utente
-                risposta = messagebox.askyesno(
-                    "Contenuto non testuale",
-                    f"Impossibile leggere come testo il file:\n{file}\n\nProseguire con hashing su contenuto binario?"
-                )
-                if risposta:
-                    try:
-                        with open(file_path, "rb") as f:
-                            content = f.read()
-                        file_hash = hashlib.sha256(content).hexdigest()
-                        hash_dict[root_folder].add(file_hash)
-                        print(f"[BINARIO] Hash calcolato per: {file_path}")
-                    except Exception as e:
-                        print(f"Errore durante l'hash binario per {file_path}: {e}")
-                else:
-                    print(f"File ignorato (utente ha rifiutato hashing binario): {file_path}")
-
-            except Exception as e:
-                print(f"Errore durante il calcolo dell'hash per {file_path}: {e}")
+            elif kind == "non_testuale":
+                non_text.append((file_path, root_folder, file_hash))
+
+    if non_text:
+        # Fallita lettura testuale → un solo popup all'utente per tutti i file
+        risposta = messagebox.askyesno(
+            "Contenuto non testuale",
+            f"Impossibile leggere come testo {len(non_text)} file.\n\n"
+            f"Proseguire con hashing su contenuto binario?"
+        )
+        for file_path, root_folder, file_hash in non_text:
+            if risposta:
+                # L'hash binario è già stato calcolato durante la lettura
+                hash_dict[root_folder].add(file_hash)
+                print(f"[BINARIO] Hash calcolato per: {file_path}")
+            else:
+                print(f"File ignorato (utente ha rifiutato hashing binario): {file_path}")
 
     return {folder: list(hashes) for folder, hashes in hash_dict.items()}
 
@@ -252,68 +732,235 @@ def create_binary_matrix(hash_csv_path):
         # Leggi il file CSV degli hash
         hash_df = pd.read_csv(hash_csv_path)
 
-        # Ottieni hash univoci e directory uniche
-        unique_hashes = sorted(hash_df["Hash"].unique())
-        directories = sorted(hash_df["Folder"].unique())
-
         # Verifica che ci siano dati validi
-        if not unique_hashes or not directories:
+        if hash_df.empty:
             print("Attenzione: nessun dato per creare la matrice binaria.")
             return pd.DataFrame()
 
-        # Inizializza la matrice binaria
-        matrix_data = np.zeros((len(unique_hashes), len(directories)), dtype=int)
-        hash_index = {h: i for i, h in enumerate(unique_hashes)}
-        dir_index = {d: i for i, d in enumerate(directories)}
-
-        # Popola la matrice binaria
-        for _, row in hash_df.iterrows():
-            folder = row["Folder"]
-            hash_value = row["Hash"]
-            matrix_data[hash_index[hash_value], dir_index[folder]] = 1
+        # Conta le occorrenze di ogni hash per cartella (righe e colonne già ordinate)
+        matrix = pd.crosstab(hash_df["Hash"], hash_df["Folder"])
+        matrix = (matrix > 0).astype(np.uint8)
+        matrix.index.name = None
+        matrix.columns.name = None
 
-        print(f"Matrice binaria creata con {len(unique_hashes)} hash e {len(directories)} cartelle.")
-        return pd.DataFrame(matrix_data, index=unique_hashes, columns=directories)
+        print(f"Matrice binaria creata con {matrix.shape[0]} hash e {matrix.shape[1]} cartelle.")
+        return matrix
 
     except Exception as e:
         print(f"Errore durante la creazione della matrice binaria: {e}")
         return pd.DataFrame()
 
+
+# Memoria indicativa per ogni blocco di righe letto dal CSV della matrice binaria (byte)
+BINARY_READ_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def _read_binary_matrix(binary_file):
+    """
+    Legge il CSV della matrice binaria come uint8, a blocchi di righe.
+
+    Ogni blocco viene verificato (solo 0 e 1) prima di essere ridotto a uint8, così in memoria
+    non c'è mai l'intera matrice con gli interi a 64 bit dedotti da pandas.
+    """
+    header = pd.read_csv(binary_file, nrows=0).columns
+    chunksize = max(1, BINARY_READ_CHUNK_BYTES // (8 * max(1, len(header) - 1)))
+
+    chunks, indexes, columns = [], [], None
+    # Gli hash restano stringhe anche se un blocco contiene solo cifre
+    dtype = {header[0]: str} if len(header) else None
+    for chunk in pd.read_csv(binary_file, index_col=0, chunksize=chunksize, dtype=dtype):
+        values = chunk.to_numpy()
+        if not ((values == 0) | (values == 1)).all():
+            raise ValueError("La matrice binaria contiene valori non validi. Devono essere solo 0 o 1.")
+        chunks.append(values.astype(np.uint8))
+        indexes.append(chunk.index)
+        columns = chunk.columns
+
+    if not chunks:
+        return pd.DataFrame()
+    # Un solo array uint8: il DataFrame lo usa senza copiarlo
+    return pd.DataFrame(np.concatenate(chunks), index=indexes[0].append(indexes[1:]), columns=columns, copy=False)
+
 # ================================
 # Fase 4: Creazione matrice Similarità
 # ================================
-def calculate_similarity(binary_matrix):
-    """Calcola la matrice di similarità tra colonne della matrice binaria."""
+# Memoria massima per la copia float32 della matrice binaria usata dal prodotto matriciale (byte).
+# Oltre questa soglia le colonne vengono compresse a bit (32 volte meno memoria): il calcolo
+# compresso non è più veloce, serve solo a contenere la memoria
+DENSE_HAMMING_MAX_BYTES = 1024 ** 3
+
+# Dimensione indicativa dei blocchi elaborati insieme, per restare nella cache L2
+HAMMING_BLOCK_BYTES = 256 * 1024
+
+# Oltre questo numero di cartelle la matrice di similarità viene scritta su disco (np.memmap)
+SIMILARITY_MEMMAP_MIN_FOLDERS = 5000
+
+# Numero di colonne per blocco nel calcolo a blocchi della similarità
+SIMILARITY_BLOCK_SIZE = 1024
+
+if hasattr(np, "bitwise_count"):
+    # NumPy >= 2.0: usa l'istruzione POPCNT del processore
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(words):
+        return _POPCOUNT_TABLE[words.view(np.uint8)]
+
+if njit is not None:
+    # Costanti per il conteggio dei bit "SWAR" su parole a 64 bit
+    _M1 = np.uint64(0x5555555555555555)
+    _M2 = np.uint64(0x3333333333333333)
+    _M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+    _H01 = np.uint64(0x0101010101010101)
+    _S1, _S2, _S4, _S56 = np.uint64(1), np.uint64(2), np.uint64(4), np.uint64(56)
+
+    @njit(parallel=True, cache=True)
+    def _hamming_packed_kernel(words):
+        """
+        Distanze di Hamming tra le righe di parole uint64, in parallelo sulle coppie di righe.
+
+        Il ciclo parallelo scorre l'indice "condensed" delle coppie (i < j), così ogni thread
+        riceve lo stesso numero di coppie invece delle righe iniziali, più lunghe.
+        """
+        n, n_words = words.shape
+        differences = np.zeros((n, n), dtype=np.int64)
+        for p in prange(n * (n - 1) // 2):
+            # Ricava la coppia (i, j) dall'indice p; la stima in virgola mobile viene corretta
+            # usando il primo indice di ogni riga, start(i) = i * (2n - i - 1) / 2
+            i = int((2 * n - 1 - np.sqrt((2 * n - 1) ** 2 - 8 * p)) // 2)
+            while i > 0 and i * (2 * n - i - 1) // 2 > p:
+                i -= 1
+            while (i + 1) * (2 * n - i - 2) // 2 <= p:
+                i += 1
+            j = p - i * (2 * n - i - 1) // 2 + i + 1
+
+            d = 0
+            for k in range(n_words):
+                x = words[i, k] ^ words[j, k]
+                x = x - ((x >> _S1) & _M1)
+                x = (x & _M2) + ((x >> _S2) & _M2)
+                x = (x + (x >> _S4)) & _M4
+                d += np.int64((x * _H01) >> _S56)
+            differences[i, j] = d
+            differences[j, i] = d
+        return differences
+
+
+def _hamming_dense(matrix_array):
+    """
+    Distanze di Hamming tra le colonne di una matrice 0/1 con un solo prodotto matriciale.
+
+    d(i, j) = n_i + n_j - 2 * |i ∩ j|; float32 è esatto per conteggi fino a 2^24.
+    """
+    matrix_array = matrix_array.astype(np.float32)
+    counts = matrix_array.sum(axis=0)
+    common = matrix_array.T @ matrix_array
+    return counts[:, None] + counts[None, :] - 2 * common
+
+
+def _hamming_packed(matrix_array):
+    """
+    Distanze di Hamming tra le colonne di una matrice 0/1 compressa a bit.
+
+    Ogni colonna diventa una riga di parole uint64 (64 hash per parola): la distanza
+    è il conteggio dei bit a 1 dello XOR, calcolato con il kernel Numba se disponibile,
+    altrimenti a blocchi che restano in cache.
+    """
+    packed = np.packbits(matrix_array.T.astype(bool), axis=1)
+    padding = -packed.shape[1] % 8
+    if padding:
+        packed = np.pad(packed, ((0, 0), (0, padding)))
+    words = np.ascontiguousarray(packed).view(np.uint64)
+
+    if njit is not None:
+        return _hamming_packed_kernel(words)
+
+    n = words.shape[0]
+    rows_per_block = max(1, HAMMING_BLOCK_BYTES // words[0].nbytes)
+    differences = np.zeros((n, n), dtype=np.int64)
+    for i in range(n):
+        for start in range(i + 1, n, rows_per_block):
+            stop = min(n, start + rows_per_block)
+            differences[i, start:stop] = _popcount(words[i] ^ words[start:stop]).sum(axis=1)
+    return differences + differences.T
+
+
+def _similarity_tiled(matrix_array, n_max, out):
+    """
+    Calcola la matrice di similarità a blocchi, scrivendola in un file mappato in memoria (np.memmap).
+
+    Solo un blocco di colonne alla volta viene elaborato in RAM, quindi la dimensione della
+    matrice di similarità non è limitata dalla memoria disponibile.
+    """
+    n = matrix_array.shape[1]
+    # float32 è esatto per conteggi fino a 2^24
+    dtype = np.float32 if matrix_array.shape[0] < 2 ** 24 else np.float64
+    similarity = np.memmap(out, dtype=np.float32, mode="w+", shape=(n, n))
+
+    block = SIMILARITY_BLOCK_SIZE
+    for i in range(0, n, block):
+        block_i = matrix_array[:, i:i + block].astype(dtype)
+        counts_i = block_i.sum(axis=0)
+        for j in range(i, n, block):
+            block_j = block_i if j == i else matrix_array[:, j:j + block].astype(dtype)
+            counts_j = block_j.sum(axis=0)
+            differences = counts_i[:, None] + counts_j[None, :] - 2 * (block_i.T @ block_j)
+            tile = np.clip(1 - differences / n_max, 0, 1)
+            similarity[i:i + block, j:j + block] = tile
+            similarity[j:j + block, i:i + block] = tile.T
+
+    np.fill_diagonal(similarity, 1.0)
+    similarity.flush()
+    return similarity
+
+
+def calculate_similarity(binary_matrix, out=None):
+    """
+    Calcola la matrice di similarità tra colonne della matrice binaria.
+
+    :param binary_matrix: Matrice binaria (hash x cartelle).
+    :param out: Percorso opzionale di un file in cui scrivere la matrice (float32, np.memmap)
+                invece di tenerla in memoria; utile con moltissime cartelle.
+    """
 
     # Controlla se la matrice binaria è vuota
     if binary_matrix.empty:
         raise ValueError("La matrice binaria è vuota. Impossibile calcolare la similarità.")
 
-    # Verifica che i valori nella matrice binaria siano solo 0 e 1
-    if not ((binary_matrix.values == 0) | (binary_matrix.values == 1)).all():
-        raise ValueError("La matrice binaria contiene valori non validi. Devono essere solo 0 o 1.")
+    # Verifica che i valori nella matrice binaria siano solo 0 e 1, una colonna alla volta
+    # per non creare copie temporanee grandi quanto l'intera matrice
+    for _, column in binary_matrix.items():
+        values = column.to_numpy()
+        if not ((values == 0) | (values == 1)).all():
+            raise ValueError("La matrice binaria contiene valori non validi. Devono essere solo 0 o 1.")
+
+    floppy_list = binary_matrix.columns.tolist()
+    # Solo dopo la verifica dei valori: uint8 occupa 8 volte meno memoria di int64
+    matrix_array = binary_matrix.values.astype(np.uint8, copy=False)
 
     # Calcola il massimo numero di hash presenti in una directory
-    n_max = binary_matrix.sum(axis=0).max()
+    n_max = matrix_array.sum(axis=0, dtype=np.int64).max()
     if n_max == 0:
         raise ValueError("La matrice binaria è vuota o non valida. Impossibile calcolare la similarità.")
 
-    # Inizializza la matrice di similarità
-    floppy_list = binary_matrix.columns.tolist()
-    similarity_matrix = pd.DataFrame(1.0, index=floppy_list, columns=floppy_list)
+    if out is not None:
+        similarity = _similarity_tiled(matrix_array, n_max, out)
+        return pd.DataFrame(similarity, index=floppy_list, columns=floppy_list, copy=False)
 
-    # Calcola la similarità tra ogni coppia di directory
-    matrix_array = binary_matrix.values
-    for i in range(len(floppy_list)):
-        for j in range(i + 1, len(floppy_list)):
-            differences = np.sum(matrix_array[:, i] != matrix_array[:, j])
-            similarity = 1 - (differences / n_max)
+    # Distanze di Hamming tra tutte le coppie di colonne; float32 è esatto solo fino a 2^24 hash
+    if matrix_array.size * 4 > DENSE_HAMMING_MAX_BYTES or matrix_array.shape[0] >= 2 ** 24:
+        differences = _hamming_packed(matrix_array)
+    else:
+        differences = _hamming_dense(matrix_array)
+
+    similarity = 1 - differences.astype(np.float64) / n_max
 
-            # Protezione per garantire che la similarità sia tra 0 e 1
-            similarity = max(0, min(1, similarity))
+    # Protezione per garantire che la similarità sia tra 0 e 1
+    np.clip(similarity, 0, 1, out=similarity)
+    np.fill_diagonal(similarity, 1.0)
 
-            similarity_matrix.iat[i, j] = similarity
-            similarity_matrix.iat[j, i] = similarity
+    similarity_matrix = pd.DataFrame(similarity, index=floppy_list, columns=floppy_list)
 
     # Restituisce la matrice di similarità
     return similarity_matrix
@@ -322,6 +969,13 @@ def calculate_similarity(binary_matrix):
 # Fase 5: Visualizzazione
 # ================================
 
+# Oltre questo numero di cartelle la heatmap non mostra i valori né i bordi delle celle
+HEATMAP_ANNOT_MAX_FOLDERS = 50
+
+# Dimensione massima della figura della heatmap (pollici)
+HEATMAP_MAX_INCHES = 40
+
+
 def visualize_similarity(input_file, visualization_type, show_numbers=True, number_fontsize=8, number_format=".2f"):
     """Fase di visualizzazione della matrice di similarità."""
     try:
@@ -336,15 +990,13 @@ def visualize_similarity(input_file, visualization_type, show_numbers=True, numb
         similarity_matrix.index = similarity_matrix.index.map(os.path.basename)
         similarity_matrix.columns = similarity_matrix.columns.map(os.path.basename)
 
-        # Converti la matrice di similarità in matrice di distanza
-        distance_matrix = 1 - similarity_matrix  # Converti in matrice di distanza
+        # I calcoli lavorano direttamente sull'array NumPy, senza passare da pandas
+        similarity = similarity_matrix.to_numpy(dtype=np.float64)
 
         if visualization_type == "Dendrogram":
             # Dendrogramma
-            from scipy.spatial.distance import squareform
-
-            # Converti la matrice di distanza in formato "condensed"
-            condensed_distance = squareform(distance_matrix, checks=False)
+            # Distanze in forma "condensed": solo il triangolo superiore, senza la matrice completa
+            condensed_distance = 1 - similarity[np.triu_indices_from(similarity, k=1)]
 
             linkage_matrix = linkage(condensed_distance, method="ward")
             plt.figure(figsize=(10, 6))
@@ -356,16 +1008,22 @@ def visualize_similarity(input_file, visualization_type, show_numbers=True, numb
 
         elif visualization_type == "Heatmap":
             n = similarity_matrix.shape[0]
-            plt.figure(figsize=(0.4 * n, 0.4 * n))  # si adatta dinamicamente
+            # Oltre la soglia i numeri (n² testi) e i bordi delle celle renderebbero il grafico illeggibile e lentissimo
+            small = n <= HEATMAP_ANNOT_MAX_FOLDERS
+            if show_numbers and not small:
+                print(f"Numeri sulla heatmap disattivati: {n} cartelle (massimo {HEATMAP_ANNOT_MAX_FOLDERS}).")
+            size = min(0.4 * n, HEATMAP_MAX_INCHES)
+            plt.figure(figsize=(size, size))  # si adatta dinamicamente
             sns.heatmap(
                 similarity_matrix,
-                annot=show_numbers,            # ✅ controllato dalla checkbox
+                annot=show_numbers and small,  # ✅ controllato dalla checkbox
                 fmt=number_format,                 # Precisione decimale
                 cmap="Greens",                 # Palette colore
                 cbar=True,
-                linewidths=0.5,
+                linewidths=0.5 if small else 0,
                 linecolor="white",
                 square=True,
+                rasterized=True,               # Le celle diventano un'unica immagine
                 annot_kws={"size": number_fontsize}  # ✅ controllato dallo slider
             )
             plt.title("Heatmap della Matrice di Similarità", fontsize=14, pad=12)
@@ -377,6 +1035,7 @@ def visualize_similarity(input_file, visualization_type, show_numbers=True, numb
 
         elif visualization_type == "PCA":
             # PCA
+            distance_matrix = 1 - similarity  # Converti in matrice di distanza
             pca = PCA(n_components=2)
             pca_result = pca.fit_transform(distance_matrix)
             plt.figure(figsize=(8, 6))
@@ -390,6 +1049,7 @@ def visualize_similarity(input_file, visualization_type, show_numbers=True, numb
 
         elif visualization_type == "K-means":
             # K-means
+            distance_matrix = 1 - similarity  # Converti in matrice di distanza
             k = 4  # Numero di cluster
             kmeans = KMeans(n_clusters=k, random_state=123).fit(distance_matrix)
             cluster_labels = kmeans.labels_
@@ -435,10 +1095,14 @@ def execute_phase():
             hash_dict = calculate_hashes(os.path.join(output_path, "1-extract"))
             hash_csv_path = os.path.join(output_path, "2-hash", "hashes.csv")
             os.makedirs(os.path.dirname(hash_csv_path), exist_ok=True)
-            pd.DataFrame(
-                [(folder, h) for folder, hashes in hash_dict.items() for h in hashes],
-                columns=["Folder", "Hash"]
-            ).to_csv(hash_csv_path, index=False)
+            # Costruisce direttamente le due colonne, senza una tupla per ogni riga;
+            # gli hash sono tenuti in memoria come byte e scritti nel CSV in esadecimale
+            folders = list(hash_dict)
+            counts = [len(hash_dict[folder]) for folder in folders]
+            pd.DataFrame({
+                "Folder": np.repeat(np.array(folders, dtype=object), counts),
+                "Hash": [h.hex() for h in chain.from_iterable(hash_dict[folder] for folder in folders)]
+            }).to_csv(hash_csv_path, index=False)
             messagebox.showinfo("Fase 2", f"Hash calcolati e salvati in: {hash_csv_path}")
 
         elif phase == "binary":
@@ -457,10 +1121,20 @@ def execute_phase():
             similarity_output_file = os.path.join(output_path, "4-similarity", "similarity_matrix.csv")
             os.makedirs(os.path.dirname(similarity_output_file), exist_ok=True)
 
-            # Legge la matrice binaria e calcola la similarità
-            binary_matrix = pd.read_csv(binary_file, index_col=0)
-            similarity_matrix = calculate_similarity(binary_matrix)
-            similarity_matrix.to_csv(similarity_output_file)
+            # Legge la matrice binaria (uint8) e calcola la similarità
+            binary_matrix = _read_binary_matrix(binary_file)
+            if binary_matrix.shape[1] >= SIMILARITY_MEMMAP_MIN_FOLDERS:
+                # Matrice troppo grande per la memoria: passa da un file temporaneo, eliminato dopo il CSV.
+                # Un errore di pulizia (file ancora mappato su Windows) non deve nascondere quello reale
+                with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as memmap_dir:
+                    similarity_matrix = calculate_similarity(
+                        binary_matrix, out=os.path.join(memmap_dir, "similarity_matrix.dat"))
+                    similarity_matrix.to_csv(similarity_output_file)
+                    # Rilascia la mappatura prima della cancellazione del file (necessario su Windows)
+                    del similarity_matrix
+            else:
+                similarity_matrix = calculate_similarity(binary_matrix)
+                similarity_matrix.to_csv(similarity_output_file)
             messagebox.showinfo("Fase 4", f"Matrice di similarità salvata in: {similarity_output_file}")
 
         elif phase == "visualize":
@@ -620,6 +1294,8 @@ def update_exclusions():
         # Aggiorna le liste di esclusione
         EXCLUDED_NAMES.extend([name.strip().lower() for name in file_exclusions if name])
         EXCLUDED_FOLDERS.extend([name.strip().lower() for name in folder_exclusions if name])
+        _compile_exclusions()
+        should_exclude.cache_clear()
         exclusion_window.destroy()
         messagebox.showinfo("Esclusioni Aggiornate", "Le esclusioni sono state aggiornate con successo!")
 